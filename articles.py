@@ -0,0 +1,80 @@
+from itertools import islice
+
+# Intestazioni note che precedono la prima riga di articoli
+START_ROW_HEADERS = ("article ref", "cases ordered")
+# Numero di righe analizzate per individuare la riga di partenza
+START_ROW_SCAN_ROWS = 30
+# Sotto questa confidenza si chiede conferma all'utente
+START_ROW_MIN_CONFIDENCE = 0.75
+
+# Intervallo dei codici articolo rappresentabili in OrderLines
+INT64_MIN = -2 ** 63
+INT64_MAX = 2 ** 63 - 1
+
+def parse_article_code(value):
+    """Converte il valore di una cella in un codice articolo intero (o None)"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float):
+        return int(value) if value.is_integer() else None
+    if isinstance(value, str):
+        value = value.strip()
+        if value.isdecimal():
+            return int(value)
+    return None
+
+def article_code_or_zero(value):
+    """Codice articolo come intero int64, 0 se non valido o fuori intervallo"""
+    code = parse_article_code(value)
+    if code is None or not (INT64_MIN <= code <= INT64_MAX):
+        return 0
+    return code
+
+def detect_start_row(column_a, known_codes):
+    """Individua la riga di partenza dai valori della colonna A.
+    
+    column_a sono i valori della colonna dalla riga 1 (ne vengono letti al più
+    START_ROW_SCAN_ROWS), known_codes i codici articolo della tabella di conversione.
+    Restituisce (riga, confidenza) con confidenza tra 0 e 1,
+    oppure (None, 0.0) se non trova righe di articoli.
+    """
+    header_row = None
+    block_start = None  # Prima riga del blocco di articoli corrente
+    block_confidence = 0.0
+    best_row = None
+    best_confidence = 0.0
+    
+    for row, value in enumerate(islice(column_a, START_ROW_SCAN_ROWS), start=1):
+        code = parse_article_code(value)
+        
+        if code is None or code < 10000:  # Almeno 5 cifre
+            block_start = None  # Fine del blocco: continua a cercare
+            if isinstance(value, str) and value.strip().lower() in START_ROW_HEADERS:
+                header_row = row
+            continue
+        
+        if block_start is None:
+            block_start = row
+            # Codice presente in tabella o subito sotto un'intestazione nota
+            if code in known_codes or header_row == row - 1:
+                block_confidence = 1.0
+            else:
+                block_confidence = 0.4
+        elif code in known_codes:
+            # Il primo articolo non e' in tabella, ma il blocco si'
+            block_confidence = max(block_confidence, 0.8)
+        
+        # Tiene il blocco piu' affidabile (ad esempio dopo un numero d'ordine iniziale)
+        if block_confidence > best_confidence:
+            best_row = block_start
+            best_confidence = block_confidence
+            if best_confidence >= 1.0:
+                break
+    
+    if best_row is not None:
+        return best_row, best_confidence
+    if header_row is not None:
+        return header_row + 1, 0.3
+    return None, 0.0
@@ -0,0 +1,580 @@
+import argparse
+import ctypes
+import json
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+import time
+
+try:
+    import resource  # Non disponibile su Windows
+except ImportError:
+    resource = None
+
+from main import OrderLines, SparConverter, OUTPUT_FORMATS
+from pdf_extraction import extraction_worker
+
+# Tempo massimo di estrazione per singolo PDF (secondi)
+DEFAULT_TIMEOUT = 120
+# Memoria massima del processo di estrazione (MB, 0 = nessun limite)
+DEFAULT_MAX_MEMORY_MB = 1024
+# Intervallo di controllo della memoria del processo di estrazione (secondi)
+WATCHDOG_INTERVAL = 0.2
+# Oltre questa frazione del limite di memoria il processo di estrazione viene sostituito
+WORKER_RECYCLE_FRACTION = 0.5
+
+def _windows_memory_mb(pid):
+    """Memoria privata (commit) di un processo Windows in MB, None se non leggibile"""
+    from ctypes import wintypes
+
+    class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+        _fields_ = [
+            ("cb", wintypes.DWORD),
+            ("PageFaultCount", wintypes.DWORD),
+            ("PeakWorkingSetSize", ctypes.c_size_t),
+            ("WorkingSetSize", ctypes.c_size_t),
+            ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+            ("PagefileUsage", ctypes.c_size_t),
+            ("PeakPagefileUsage", ctypes.c_size_t),
+        ]
+
+    PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
+    PROCESS_VM_READ = 0x0010
+
+    kernel32 = ctypes.WinDLL("kernel32", use_last_error=True)
+    psapi = ctypes.WinDLL("psapi", use_last_error=True)
+    kernel32.OpenProcess.restype = wintypes.HANDLE
+    kernel32.OpenProcess.argtypes = [wintypes.DWORD, wintypes.BOOL, wintypes.DWORD]
+    kernel32.CloseHandle.argtypes = [wintypes.HANDLE]
+    psapi.GetProcessMemoryInfo.argtypes = [wintypes.HANDLE, ctypes.POINTER(PROCESS_MEMORY_COUNTERS), wintypes.DWORD]
+
+    handle = kernel32.OpenProcess(PROCESS_QUERY_LIMITED_INFORMATION | PROCESS_VM_READ, False, pid)
+    if not handle:
+        return None
+    try:
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(counters)
+        if not psapi.GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb):
+            return None
+        return counters.PagefileUsage / (1024 * 1024)
+    finally:
+        kernel32.CloseHandle(handle)
+
+def process_memory_mb(pid):
+    """Memoria usata da un processo in MB, None se non leggibile su questa piattaforma"""
+    if sys.platform == "win32":
+        return _windows_memory_mb(pid)
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+def memory_limit_supported():
+    """Indica se il limite di memoria può essere applicato su questa piattaforma"""
+    return resource is not None or sys.platform == "win32" or os.path.exists("/proc/self/status")
+
+class ExtractionWorker:
+    """Processo di estrazione dei PDF, riutilizzato per più file.
+
+    Il processo viene avviato al primo PDF e sostituito solo quando viene
+    terminato (timeout, limite di memoria, crash): così l'avvio del processo,
+    lento su Windows, si paga una volta per worker e non per ogni file. Il
+    limite di memoria è applicato con RLIMIT_AS dove disponibile e, su tutte le
+    piattaforme (Windows compreso), da un controllo periodico della memoria.
+
+    extractor sostituisce pdf_extraction.extract_columns (deve essere una
+    funzione di modulo, per poter essere passata al processo).
+    """
+
+    def __init__(self, max_memory_mb=DEFAULT_MAX_MEMORY_MB, extractor=None):
+        self.max_memory_mb = max_memory_mb
+        self.extractor = extractor
+        self.process = None
+        self.conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _start(self):
+        parent_conn, child_conn = multiprocessing.Pipe()
+        args = (child_conn, self.max_memory_mb)
+        if self.extractor is not None:
+            args += (self.extractor,)
+        process = multiprocessing.Process(target=extraction_worker, args=args, daemon=True)
+        try:
+            process.start()
+        except Exception:
+            parent_conn.close()
+            raise
+        finally:
+            child_conn.close()
+        self.process = process
+        self.conn = parent_conn
+
+    def stop(self, kill=False):
+        """Chiude il processo di estrazione; kill=True lo termina senza attendere"""
+        if self.process is None:
+            return
+        if not kill and self.process.is_alive():
+            try:
+                self.conn.send(None)  # Fine del lavoro
+            except OSError:
+                pass
+            self.process.join(1)
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join()
+        self.conn.close()
+        self.process = None
+        self.conn = None
+
+    def extract(self, pdf_file, timeout=DEFAULT_TIMEOUT):
+        """Estrae i dati da un PDF con timeout e limite di memoria.
+
+        Restituisce (righe, None) in caso di successo, (None, messaggio) in caso
+        di errore. Non solleva eccezioni: un errore segna come fallito solo
+        questo file e, se il processo è compromesso, il file successivo parte
+        con un processo nuovo.
+        """
+        try:
+            if self.process is None:
+                self._start()
+            self.conn.send(pdf_file)
+
+            deadline = time.monotonic() + timeout
+            while not self.conn.poll(max(0.0, min(WATCHDOG_INTERVAL, deadline - time.monotonic()))):
+                if time.monotonic() >= deadline:
+                    self.stop(kill=True)
+                    return None, f"Timeout: estrazione oltre {timeout} secondi"
+                if self.max_memory_mb:
+                    memory_mb = process_memory_mb(self.process.pid)
+                    if memory_mb is not None and memory_mb > self.max_memory_mb:
+                        self.stop(kill=True)
+                        return None, f"Limite di memoria superato ({memory_mb:.0f} MB su {self.max_memory_mb} MB)"
+            status, payload = self.conn.recv()
+        except EOFError:
+            # Il processo è terminato senza rispondere (crash o memoria esaurita)
+            self.process.join(1)
+            exitcode = self.process.exitcode
+            self.stop(kill=True)
+            return None, f"Processo di estrazione terminato (codice {exitcode})"
+        except Exception as e:
+            self.stop(kill=True)
+            return None, f"Errore del processo di estrazione: {str(e)}"
+
+        if status == "memoria":
+            self.stop()
+        elif status == "ok" and self.max_memory_mb:
+            # Sostituisce il processo se la memoria trattenuta si avvicina al limite
+            memory_mb = process_memory_mb(self.process.pid)
+            if memory_mb is not None and memory_mb > self.max_memory_mb * WORKER_RECYCLE_FRACTION:
+                self.stop()
+        if status != "ok":
+            return None, payload
+        return OrderLines(*payload), None
+
+def extract_isolated(pdf_file, timeout=DEFAULT_TIMEOUT, max_memory_mb=DEFAULT_MAX_MEMORY_MB, extractor=None):
+    """Estrae un singolo PDF in un processo dedicato, poi chiuso (vedi ExtractionWorker)"""
+    with ExtractionWorker(max_memory_mb, extractor) as worker:
+        return worker.extract(pdf_file, timeout)
+
+def find_pdf_files(folder):
+    """Restituisce i PDF della cartella in ordine alfabetico"""
+    return sorted(
+        os.path.join(folder, name) for name in os.listdir(folder)
+        if name.lower().endswith('.pdf')
+    )
+
+def find_order_files(folder):
+    """Restituisce gli ordini PDF ed Excel della cartella, esclusi i file generati"""
+    return sorted(
+        os.path.join(folder, name) for name in os.listdir(folder)
+        if name.lower().endswith(('.pdf', '.xlsx'))
+        and not name.startswith('temp_conversion_')
+        and '_CONVERTITO' not in name
+    )
+
+def load_conversion_table(conversion_file):
+    """Carica una sola volta la tabella di conversione per tutto il batch"""
+    converter = SparConverter(conversion_file, None, interactive=False)
+    return converter.load_conversion_table(), converter.last_error
+
+def prepare_order(conversion_file, pdf_file, data, output_format, conversion_dict):
+    """Converte in memoria le righe già estratte di un ordine, senza file temporanei.
+
+    Restituisce (converter, None) se pronto per il salvataggio, altrimenti
+    (converter o None, errore).
+    """
+    if not data:
+        return None, "Nessun dato trovato nel PDF"
+
+    converter = SparConverter(conversion_file, pdf_file, interactive=False, order_lines=data)
+    try:
+        if not converter.transform(output_format, conversion_dict):
+            return converter, converter.last_error or "Conversione non completata"
+    except Exception as e:
+        return converter, f"Errore durante la conversione: {str(e)}"
+    return converter, None
+
+def save_order(converter, output_format):
+    """Salva un ordine già convertito. Restituisce (file di output, errore)"""
+    output_file = converter.get_output_file(output_format=output_format)
+    try:
+        converter.save_output(output_file, output_format, converter.result_lines)
+    except Exception as e:
+        return None, f"Impossibile salvare il file: {str(e)}"
+    return output_file, None
+
+def _result(pdf_file, output_file, error, start, converter=None):
+    return {
+        "file": pdf_file,
+        "ok": error is None,
+        "output": output_file,
+        "errore": error,
+        "confidenza_riga": converter.start_row_confidence if converter is not None else None,
+        "secondi": round(time.perf_counter() - start, 3),
+    }
+
+def run_batch(folder, conversion_file, output_format="xlsx",
+              timeout=DEFAULT_TIMEOUT, max_memory_mb=DEFAULT_MAX_MEMORY_MB):
+    """Converte tutti i PDF di una cartella, uno alla volta.
+
+    Le estrazioni avvengono in un processo isolato, riutilizzato tra i file:
+    un PDF che supera il timeout o il limite di memoria viene segnato come
+    fallito e il batch prosegue con i file successivi.
+    """
+    pdf_files = find_pdf_files(folder)
+    conversion_dict, error = load_conversion_table(conversion_file)
+    if conversion_dict is None:
+        return [_result(pdf_file, None, error, time.perf_counter()) for pdf_file in pdf_files]
+
+    results = []
+    with ExtractionWorker(max_memory_mb) as worker:
+        for pdf_file in pdf_files:
+            start = time.perf_counter()
+            output_file = None
+            converter = None
+            data, error = worker.extract(pdf_file, timeout)
+            if error is None:
+                converter, error = prepare_order(conversion_file, pdf_file, data, output_format, conversion_dict)
+            if error is None:
+                output_file, error = save_order(converter, output_format)
+            results.append(_result(pdf_file, output_file, error, start, converter))
+    return results
+
+def dry_run_order(conversion_file, order_file, conversion_dict,
+                  timeout=DEFAULT_TIMEOUT, max_memory_mb=DEFAULT_MAX_MEMORY_MB, worker=None):
+    """Verifica un singolo ordine (PDF o Excel) senza scrivere output.
+
+    worker permette di riutilizzare un ExtractionWorker già avviato.
+    """
+    start = time.perf_counter()
+    order_lines = None
+    if order_file.lower().endswith('.pdf'):
+        if worker is None:
+            data, error = extract_isolated(order_file, timeout, max_memory_mb)
+        else:
+            data, error = worker.extract(order_file, timeout)
+        if error is None and not data:
+            error = "Nessun dato trovato nel PDF"
+        if error is not None:
+            return {"file": order_file, "ok": False, "errore": error,
+                    "secondi": round(time.perf_counter() - start, 3)}
+        order_lines = data
+
+    converter = SparConverter(conversion_file, order_file, interactive=False, order_lines=order_lines)
+    try:
+        report = converter.dry_run(conversion_dict)
+    except Exception as e:
+        converter.last_error = f"Errore durante la verifica: {str(e)}"
+        report = None
+    if report is None:
+        report = {"file": order_file, "ok": False, "errore": converter.last_error,
+                  "confidenza_riga": converter.start_row_confidence}
+    else:
+        report["ok"] = True
+    report["secondi"] = round(time.perf_counter() - start, 3)
+    return report
+
+def run_dry_run(folder, conversion_file, timeout=DEFAULT_TIMEOUT, max_memory_mb=DEFAULT_MAX_MEMORY_MB):
+    """Verifica tutti gli ordini di una cartella contro la tabella di conversione.
+
+    Non formatta e non salva nulla: per ogni file riporta codici non mappati,
+    moltiplicatori applicati e totali.
+    """
+    order_files = find_order_files(folder)
+    conversion_dict, error = load_conversion_table(conversion_file)
+    if conversion_dict is None:
+        return [{"file": order_file, "ok": False, "errore": error} for order_file in order_files]
+    with ExtractionWorker(max_memory_mb) as worker:
+        return [
+            dry_run_order(conversion_file, order_file, conversion_dict, timeout, max_memory_mb, worker)
+            for order_file in order_files
+        ]
+
+class StageStats:
+    """Tempo di lavoro e numero di elementi elaborati da uno stadio della pipeline"""
+
+    def __init__(self, name, workers):
+        self.name = name
+        self.workers = workers
+        self.items = 0
+        self.busy = 0.0
+        self.lock = threading.Lock()
+
+    def add(self, seconds):
+        with self.lock:
+            self.items += 1
+            self.busy += seconds
+
+    def report(self, elapsed):
+        """Utilizzo = tempo di lavoro / (durata totale x numero di worker)"""
+        capacity = elapsed * self.workers
+        return {
+            "worker": self.workers,
+            "elaborati": self.items,
+            "occupato_s": round(self.busy, 3),
+            "utilizzo": round(self.busy / capacity, 3) if capacity else 0.0,
+        }
+
+_DONE = object()  # Segnale di fine coda per i worker
+
+def run_pipeline(folder, conversion_file, output_format="xlsx",
+                 timeout=DEFAULT_TIMEOUT, max_memory_mb=DEFAULT_MAX_MEMORY_MB,
+                 extract_workers=2, convert_workers=1, write_workers=1, queue_size=4):
+    """Converte tutti i PDF di una cartella con una pipeline a tre stadi.
+
+    Estrazione (un processo isolato per worker), conversione e scrittura lavorano in
+    parallelo, collegate da code limitate a queue_size elementi: mentre un
+    ordine viene salvato, il successivo è già in estrazione.
+
+    Restituisce (risultati per file, statistiche di utilizzo per stadio).
+    """
+    for name, value in (("extract_workers", extract_workers), ("convert_workers", convert_workers),
+                        ("write_workers", write_workers), ("queue_size", queue_size)):
+        if value < 1:
+            raise ValueError(f"{name} deve essere almeno 1")
+
+    pdf_files = find_pdf_files(folder)
+    conversion_dict, error = load_conversion_table(conversion_file)
+    if conversion_dict is None:
+        return [_result(pdf_file, None, error, time.perf_counter()) for pdf_file in pdf_files], {}
+
+    stats = {
+        "estrazione": StageStats("estrazione", extract_workers),
+        "conversione": StageStats("conversione", convert_workers),
+        "scrittura": StageStats("scrittura", write_workers),
+    }
+    extract_queue = queue.Queue()
+    convert_queue = queue.Queue(maxsize=queue_size)
+    write_queue = queue.Queue(maxsize=queue_size)
+    results = {}
+    results_lock = threading.Lock()
+
+    def finish(pdf_file, output_file, error, start, converter=None):
+        with results_lock:
+            results[pdf_file] = _result(pdf_file, output_file, error, start, converter)
+
+    def extract_stage():
+        # Ogni worker di estrazione riutilizza il proprio processo
+        with ExtractionWorker(max_memory_mb) as worker:
+            while True:
+                item = extract_queue.get()
+                if item is _DONE:
+                    return
+                pdf_file = item
+                start = time.perf_counter()
+                try:
+                    data, error = worker.extract(pdf_file, timeout)
+                    stats["estrazione"].add(time.perf_counter() - start)
+                except Exception as e:
+                    finish(pdf_file, None, str(e), start)
+                    continue
+                if error is None:
+                    convert_queue.put((pdf_file, start, data))
+                else:
+                    finish(pdf_file, None, error, start)
+
+    def convert_stage():
+        while True:
+            item = convert_queue.get()
+            if item is _DONE:
+                return
+            pdf_file, start, data = item
+            t0 = time.perf_counter()
+            try:
+                converter, error = prepare_order(conversion_file, pdf_file, data, output_format, conversion_dict)
+                stats["conversione"].add(time.perf_counter() - t0)
+            except Exception as e:
+                finish(pdf_file, None, str(e), start)
+                continue
+            if error is None:
+                write_queue.put((pdf_file, start, converter))
+            else:
+                finish(pdf_file, None, error, start, converter)
+
+    def write_stage():
+        while True:
+            item = write_queue.get()
+            if item is _DONE:
+                return
+            pdf_file, start, converter = item
+            t0 = time.perf_counter()
+            try:
+                output_file, error = save_order(converter, output_format)
+                stats["scrittura"].add(time.perf_counter() - t0)
+            except Exception as e:
+                output_file, error = None, str(e)
+            finish(pdf_file, output_file, error, start, converter)
+
+    def start_workers(target, count):
+        threads = [threading.Thread(target=target, daemon=True) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        return threads
+
+    pipeline_start = time.perf_counter()
+    extract_threads = start_workers(extract_stage, extract_workers)
+    convert_threads = start_workers(convert_stage, convert_workers)
+    write_threads = start_workers(write_stage, write_workers)
+
+    for pdf_file in pdf_files:
+        extract_queue.put(pdf_file)
+
+    # Chiude gli stadi in ordine: ogni stadio termina quando il precedente ha finito
+    stages = [
+        (extract_queue, extract_threads),
+        (convert_queue, convert_threads),
+        (write_queue, write_threads),
+    ]
+    for stage_queue, threads in stages:
+        for _ in threads:
+            stage_queue.put(_DONE)
+        for thread in threads:
+            thread.join()
+
+    elapsed = time.perf_counter() - pipeline_start
+    report = {name: stage.report(elapsed) for name, stage in stats.items()}
+    return [
+        results.get(pdf_file) or _result(pdf_file, None, "File non elaborato", pipeline_start)
+        for pdf_file in pdf_files
+    ], report
+
+def positive_int(value):
+    """Tipo argparse per interi maggiori di zero"""
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"deve essere almeno 1: {value}")
+    return number
+
+def positive_float(value):
+    """Tipo argparse per numeri maggiori di zero"""
+    number = float(value)
+    if not number > 0:
+        raise argparse.ArgumentTypeError(f"deve essere maggiore di zero: {value}")
+    return number
+
+def non_negative_int(value):
+    """Tipo argparse per interi maggiori o uguali a zero"""
+    number = int(value)
+    if number < 0:
+        raise argparse.ArgumentTypeError(f"non può essere negativo: {value}")
+    return number
+
+def default_report_file(folder):
+    """Report accanto agli output, per l'eseguibile senza console"""
+    return os.path.join(folder, f"report_conversione_{time.strftime('%Y%m%d_%H%M%S')}.json")
+
+def write_report(report_file, data):
+    """Scrive il report JSON del batch"""
+    with open(report_file, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Conversione SPAR batch di una cartella di ordini")
+    parser.add_argument("folder", help="Cartella con gli ordini PDF")
+    parser.add_argument("--conversion", required=True, help="File SPAR CONVERSION.xlsm")
+    parser.add_argument("--format", default="xlsx", choices=sorted(OUTPUT_FORMATS), help="Formato di output")
+    parser.add_argument("--timeout", type=positive_float, default=DEFAULT_TIMEOUT,
+                        help="Tempo massimo di estrazione per PDF in secondi")
+    parser.add_argument("--max-memory", type=non_negative_int, default=DEFAULT_MAX_MEMORY_MB,
+                        help="Memoria massima per l'estrazione di un PDF in MB (0 = nessun limite); "
+                             "il processo che la supera viene terminato")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="Sovrappone estrazione, conversione e scrittura di ordini diversi")
+    parser.add_argument("--extract-workers", type=positive_int, default=2, help="Worker di estrazione (con --pipeline)")
+    parser.add_argument("--convert-workers", type=positive_int, default=1, help="Worker di conversione (con --pipeline)")
+    parser.add_argument("--write-workers", type=positive_int, default=1, help="Worker di scrittura (con --pipeline)")
+    parser.add_argument("--queue-size", type=positive_int, default=4, help="Capienza delle code tra gli stadi (con --pipeline)")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Verifica gli ordini (PDF ed Excel) senza scrivere output; riepilogo JSON")
+    parser.add_argument("--report", help="File JSON con l'esito di ogni file (senza console viene "
+                                         "scritto comunque nella cartella degli ordini)")
+    args = parser.parse_args(argv)
+
+    # L'eseguibile PyInstaller senza console non ha stdout: l'esito va su file
+    report_file = args.report
+    if report_file is None and sys.stdout is None:
+        report_file = default_report_file(args.folder)
+
+    if args.max_memory and not memory_limit_supported():
+        print("Attenzione: limite di memoria non applicabile su questa piattaforma, verrà ignorato",
+              file=sys.stderr)
+
+    if args.dry_run:
+        reports = run_dry_run(args.folder, args.conversion, args.timeout, args.max_memory)
+        print(json.dumps(reports, indent=2, ensure_ascii=False))
+        if report_file:
+            write_report(report_file, reports)
+        return 0 if all(report["ok"] for report in reports) else 1
+
+    report = None
+    if args.pipeline:
+        results, report = run_pipeline(
+            args.folder, args.conversion, args.format, args.timeout, args.max_memory,
+            args.extract_workers, args.convert_workers, args.write_workers, args.queue_size
+        )
+    else:
+        results = run_batch(args.folder, args.conversion, args.format, args.timeout, args.max_memory)
+
+    failed = 0
+    for result in results:
+        name = os.path.basename(result["file"])
+        if result["ok"]:
+            print(f"OK      {name} -> {os.path.basename(result['output'])} ({result['secondi']} s)")
+        else:
+            failed += 1
+            print(f"ERRORE  {name}: {result['errore']} ({result['secondi']} s)")
+    print(f"Convertiti {len(results) - failed} file su {len(results)}")
+
+    if report:
+        print("Utilizzo degli stadi:")
+        for name, stage in report.items():
+            print(f"  {name:<12} worker={stage['worker']} elaborati={stage['elaborati']} "
+                  f"occupato={stage['occupato_s']} s utilizzo={stage['utilizzo']:.0%}")
+
+    if report_file:
+        write_report(report_file, {
+            "convertiti": len(results) - failed,
+            "falliti": failed,
+            "risultati": results,
+            "utilizzo": report or {},
+        })
+
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    raise SystemExit(main())
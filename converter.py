@@ -4,6 +4,7 @@ from openpyxl.utils.dataframe import dataframe_to_rows
 import tkinter as tk
 from tkinter import simpledialog, messagebox
 import os
+from articles import START_ROW_MIN_CONFIDENCE, detect_start_row, parse_article_code
 
 class SparConverter:
     def __init__(self, conversion_file, input_file):
@@ -50,15 +51,31 @@ class SparConverter:
             adjusted_width = (max_length + 2) * 1.2
             self.ws.column_dimensions[column_letter].width = adjusted_width
     
-    def get_start_row(self):
-        """Chiede all'utente la riga di partenza"""
+    def detect_start_row(self, conversion_df):
+        """Individua la riga di partenza analizzando le prime righe del foglio.
+        
+        Restituisce (riga, confidenza) con confidenza tra 0 e 1,
+        oppure (None, 0.0) se non trova righe di articoli.
+        """
+        known_codes = set(parse_article_code(v) for v in conversion_df.iloc[:, 0])
+        column_a = (self.ws[f'A{row}'].value for row in range(1, self.ws.max_row + 1))
+        return detect_start_row(column_a, known_codes)
+    
+    def get_start_row(self, conversion_df=None):
+        """Determina la riga di partenza, chiedendo all'utente solo se la rilevazione e' incerta"""
+        detected_row = None
+        if conversion_df is not None:
+            detected_row, confidence = self.detect_start_row(conversion_df)
+            if detected_row is not None and confidence >= START_ROW_MIN_CONFIDENCE:
+                return detected_row
+        
         root = tk.Tk()
         root.withdraw()  # Nasconde la finestra principale
         
         user_input = simpledialog.askstring(
             "Riga di Partenza", 
             "Inserisci il numero della riga di partenza (es. 5 o 6):", 
-            initialvalue="6"
+            initialvalue=str(detected_row or 6)
         )
         
         root.destroy()
@@ -168,16 +185,16 @@ class SparConverter:
         # Pre-processing
         self.pre_processing()
         
-        # Ottiene la riga di partenza
-        self.start_row = self.get_start_row()
-        if self.start_row is None:
-            return False
-        
         # Carica la tabella di conversione
         conversion_df = self.load_conversion_table()
         if conversion_df is None:
             return False
         
+        # Rileva la riga di partenza (chiede all'utente solo se incerta)
+        self.start_row = self.get_start_row(conversion_df)
+        if self.start_row is None:
+            return False
+        
         # Applica VLOOKUP
         self.apply_vlookup(conversion_df)
         
@@ -1,122 +1,246 @@
+import multiprocessing
+import sys
+
+if __name__ == "__main__":
+    # Nell'eseguibile PyInstaller i processi di estrazione ripartono da qui:
+    # avviano subito il worker, senza importare tkinter, pandas e numpy
+    multiprocessing.freeze_support()
+
 import tkinter as tk
 from tkinter import filedialog, messagebox, simpledialog
 import openpyxl
 import pandas as pd
 import os
-import pdfplumber
+import importlib.util
 from pathlib import Path
-import re
+import csv
+from array import array
+import numpy as np
+from pdf_extraction import extract_columns
+from articles import (
+    START_ROW_MIN_CONFIDENCE, article_code_or_zero, detect_start_row, parse_article_code
+)
+
+# Formati di output supportati e relativa estensione
+OUTPUT_FORMATS = {
+    "xlsx": ".xlsx",       # Workbook completo con formattazione
+    "xlsx-lean": ".xlsx",  # Workbook in sola scrittura, solo codice e quantità
+    "csv": ".csv",
+}
+# Parquet solo se pyarrow e' installato (non incluso nella build di default)
+if importlib.util.find_spec("pyarrow") is not None:
+    OUTPUT_FORMATS["parquet"] = ".parquet"
+# Colonne dei formati snelli, per l'import nell'ERP
+OUTPUT_HEADERS = ["Codice", "Quantita"]
+
+# Moltiplicatori per codice SPAR (come nel VBA originale)
+CODE_MULTIPLIERS = {
+    11005101: 4, 11005102: 4, 11005111: 4, 11005112: 4, 11005107: 4, 11005113: 4,
+    11005382: 3, 11005387: 3,
+    11004140: 2, 11004141: 2,
+}
 
-class PDFConverter:
-    def __init__(self, pdf_file):
+class OrderLine:
+    """Vista su una singola riga d'ordine"""
+    __slots__ = ("code", "quantity", "unit_qty")
+    
+    def __init__(self, code, quantity, unit_qty=None):
+        self.code = code
+        self.quantity = quantity
+        self.unit_qty = unit_qty
+    
+    def __repr__(self):
+        return f"OrderLine({self.code}, {self.quantity}, {self.unit_qty})"
+
+class OrderLines:
+    """Righe d'ordine in forma colonnare: codici int64 e quantità float64.
+    
+    Usata tra estrazione, lookup e scrittura al posto di liste di righe,
+    così le fasi di conversione lavorano su interi array. I codici convertiti
+    restano un array di oggetti se la tabella contiene valori non interi.
+    """
+    __slots__ = ("codes", "quantities", "unit_qtys")
+    
+    def __init__(self, codes=(), quantities=(), unit_qtys=None):
+        codes = np.asarray(codes)
+        self.codes = codes if codes.dtype == object else codes.astype(np.int64)
+        self.quantities = np.asarray(quantities, dtype=np.float64)
+        self.unit_qtys = None if unit_qtys is None else np.asarray(unit_qtys, dtype=np.float64)
+    
+    @classmethod
+    def concat(cls, parts):
+        """Unisce più ordini in un unico blocco di righe"""
+        parts = list(parts)
+        if not parts:
+            return cls()
+        unit_qtys = None
+        if all(part.unit_qtys is not None for part in parts):
+            unit_qtys = np.concatenate([part.unit_qtys for part in parts])
+        return cls(np.concatenate([part.codes for part in parts]),
+                   np.concatenate([part.quantities for part in parts]),
+                   unit_qtys)
+    
+    def __len__(self):
+        return len(self.codes)
+    
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            unit_qty = None if self.unit_qtys is None else float(self.unit_qtys[index])
+            code = self.codes[index]
+            if isinstance(code, np.generic):
+                code = code.item()
+            return OrderLine(code, float(self.quantities[index]), unit_qty)
+        # Slice o maschera booleana: restituisce un nuovo blocco
+        unit_qtys = None if self.unit_qtys is None else self.unit_qtys[index]
+        return OrderLines(self.codes[index], self.quantities[index], unit_qtys)
+    
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+    
+    def map_codes(self, conversion_dict):
+        """Equivalente vettoriale del VLOOKUP: 0 per i codici non in tabella.
+        
+        I valori della tabella sono riportati così come sono: il risultato è
+        int64 se sono tutti interi, altrimenti un array di oggetti.
+        """
+        # Un lookup per codice distinto, poi ridistribuito su tutte le righe
+        uniques, inverse = np.unique(self.codes, return_inverse=True)
+        values = [conversion_dict.get(int(code), 0) if code != 0 else 0 for code in uniques]
+        
+        table = None
+        if all(type(value) is int for value in values):
+            try:
+                table = np.asarray(values, dtype=np.int64)
+            except OverflowError:
+                pass
+        if table is None:
+            table = np.empty(len(values), dtype=object)
+            table[:] = values
+        return table[inverse.reshape(-1)]
+    
+    @staticmethod
+    def converted_mask(mapped):
+        """Righe da tenere dopo il lookup (scarta 0 e "0" come delete_zero_rows)"""
+        if mapped.dtype != object:
+            return mapped != 0
+        return np.array([not (value == 0 or value == "0") for value in mapped], dtype=bool)
+    
+    def multipliers(self):
+        """Moltiplicatore di ogni riga secondo CODE_MULTIPLIERS"""
+        if self.codes.dtype == object:
+            return np.array([CODE_MULTIPLIERS.get(code, 1) for code in self.codes], dtype=np.float64)
+        result = np.ones(len(self), dtype=np.float64)
+        for code, multiplier in CODE_MULTIPLIERS.items():
+            result[self.codes == code] = multiplier
+        return result
+    
+    def convert(self, conversion_dict):
+        """Converte i codici e applica i moltiplicatori, scartando le righe non in tabella"""
+        mapped = self.map_codes(conversion_dict)
+        keep = self.converted_mask(mapped)
+        converted = OrderLines(mapped[keep], self.quantities[keep])
+        converted.quantities = converted.quantities * converted.multipliers()
+        return converted
+    
+    def validation_report(self, conversion_dict):
+        """Riepilogo del lookup senza conversione: codici non in tabella, moltiplicatori e totali"""
+        mapped = self.map_codes(conversion_dict)
+        found = self.converted_mask(mapped)
+        converted = OrderLines(mapped[found], self.quantities[found])
+        unmapped = self.codes[~found]
+        
+        multiplier_hits = {}
+        for code, multiplier in CODE_MULTIPLIERS.items():
+            count = int(np.count_nonzero(converted.codes == code))
+            if count:
+                multiplier_hits[str(code)] = {"moltiplicatore": multiplier, "righe": count}
+        
+        return {
+            "righe": len(self),
+            "righe_convertite": int(np.count_nonzero(found)),
+            "righe_eliminate": int(np.count_nonzero(~found)),
+            "righe_non_valide": int(np.count_nonzero(unmapped == 0)),
+            "codici_non_mappati": np.unique(unmapped[unmapped != 0]).tolist(),
+            "moltiplicatori": multiplier_hits,
+            "quantita_totale": float((converted.quantities * converted.multipliers()).sum()),
+        }
+    
+    def to_rows(self):
+        """Restituisce le righe come liste [codice, quantità]"""
+        return [[code, quantity] for code, quantity in zip(self.codes.tolist(), self.quantities.tolist())]
+    
+    def to_dataframe(self, columns):
+        """Restituisce codici e quantità come DataFrame con le colonne indicate"""
+        codes = self.codes
+        if codes.dtype == object:
+            # Parquet richiede colonne di un solo tipo
+            codes = codes.astype(str)
+        return pd.DataFrame({columns[0]: codes, columns[1]: self.quantities})
+
+class MessageMixin:
+    """Messaggi all'utente, soppressi quando si lavora senza interfaccia"""
+    interactive = True
+    last_error = None
+    
+    def _info(self, title, message):
+        if self.interactive:
+            messagebox.showinfo(title, message)
+    
+    def _error(self, title, message):
+        self.last_error = message
+        if self.interactive:
+            messagebox.showerror(title, message)
+
+class PDFConverter(MessageMixin):
+    def __init__(self, pdf_file, interactive=True):
         self.pdf_file = pdf_file
+        self.interactive = interactive
         
     def extract_data_from_pdf(self):
         """Estrae i dati dall'ordine PDF con logica specifica per il formato GSD"""
         try:
-            with pdfplumber.open(self.pdf_file) as pdf:
-                all_data = []
-                
-                for page in pdf.pages:
-                    # Prova prima con l'estrazione delle tabelle
-                    tables = page.extract_tables()
-                    
-                    for table in tables:
-                        for i, row in enumerate(table):
-                            # Salta l'header della tabella
-                            if i == 0 and ("Article Ref" in str(row) or "Cases Ordered" in str(row)):
-                                continue
-                            
-                            # Cerca righe con il formato: numero, numero, numero
-                            if (row and len(row) >= 3 and 
-                                row[0] and row[1] and row[2] and
-                                self._looks_like_article_data(row)):
-                                clean_row = self._clean_row_data(row)
-                                if clean_row:
-                                    all_data.append(clean_row)
-                    
-                    # Se non ha trovato dati nelle tabelle, prova con l'estrazione del testo
-                    if not all_data:
-                        text = page.extract_text()
-                        if text:
-                            pdf_data = self._extract_from_text(text)
-                            all_data.extend(pdf_data)
-                
-                return all_data
-                
+            codes, cases, unit_qtys = extract_columns(self.pdf_file)
+            return OrderLines(codes, cases, unit_qtys)
         except Exception as e:
-            messagebox.showerror("Errore", f"Impossibile leggere il PDF: {str(e)}")
+            self._error("Errore", f"Impossibile leggere il PDF: {str(e)}")
             return None
     
-    def _looks_like_article_data(self, row):
-        """Verifica se la riga sembra contenere dati di articoli"""
-        if len(row) < 3:
-            return False
+    def build_workbook(self, data):
+        """Crea in memoria il workbook con le righe estratte dal PDF"""
+        wb = openpyxl.Workbook()
+        ws = wb.active
+        ws.title = "Order Data"
+        
+        # Intestazioni: la colonna C viene sostituita dal codice convertito,
+        # la D porta la quantità ordinata come nei file Excel SPAR
+        headers = ["Article Ref", "Cases Ordered", "Unit Qty", "Quantity"]
+        ws.append(headers)
+        
+        # Aggiungi i dati
+        for line in data:
+            ws.append([line.code, line.quantity, line.unit_qty, line.quantity])
+        
+        # Formatta le colonne
+        for col in range(1, 5):
+            col_letter = openpyxl.utils.get_column_letter(col)
+            ws.column_dimensions[col_letter].width = 15
         
-        # Il primo campo dovrebbe essere un codice articolo (solo numeri)
-        article_ref = str(row[0]).strip()
-        if article_ref and re.match(r'^\d{5,}$', article_ref):  # Almeno 5 cifre
-            return True
-        return False
-    
-    def _clean_row_data(self, row):
-        """Pulisce i dati della riga"""
-        try:
-            article_ref = str(row[0]).strip()
-            cases_ordered = str(row[1]).strip().replace(',', '.')
-            unit_qty = str(row[2]).strip().replace(',', '.')
-            
-            # Verifica che siano numeri validi
-            if (re.match(r'^\d+$', article_ref) and
-                re.match(r'^\d*\.?\d+$', cases_ordered) and
-                re.match(r'^\d*\.?\d+$', unit_qty)):
-                return [article_ref, float(cases_ordered), float(unit_qty)]
-        except:
-            pass
-        return None
+        return wb
     
-    def _extract_from_text(self, text):
-        """Estrae dati dal testo del PDF"""
-        data = []
-        lines = text.split('\n')
-        
-        for line in lines:
-            # Cerca pattern: numero (8+ cifre) seguito da numeri decimali
-            match = re.search(r'(\d{8,})\s+(\d+\.?\d*)\s+(\d+\.?\d*)', line.strip())
-            if match:
-                article_ref = match.group(1)
-                cases_ordered = match.group(2)
-                unit_qty = match.group(3)
-                data.append([article_ref, float(cases_ordered), float(unit_qty)])
-        
-        return data
-    
-    def pdf_to_excel(self):
-        """Converte il PDF in un file Excel temporaneo"""
-        data = self.extract_data_from_pdf()
+    def pdf_to_excel(self, data=None):
+        """Converte il PDF in un file Excel temporaneo.
+        
+        data può contenere righe già estratte (ad esempio da un processo separato).
+        """
+        if data is None:
+            data = self.extract_data_from_pdf()
         if not data:
-            messagebox.showerror("Errore", "Nessun dato trovato nel PDF. Verifica il formato del file.")
+            self._error("Errore", "Nessun dato trovato nel PDF. Verifica il formato del file.")
             return None
         
         try:
-            # Crea un nuovo workbook
-            wb = openpyxl.Workbook()
-            ws = wb.active
-            ws.title = "Order Data"
-            
-            # Intestazioni
-            headers = ["Article Ref", "Cases Ordered", "Unit Qty"]
-            ws.append(headers)
-            
-            # Aggiungi i dati
-            for row in data:
-                if len(row) >= 3:
-                    ws.append([row[0], row[1], row[2]])
-            
-            # Formatta le colonne
-            for col in range(1, 4):
-                col_letter = openpyxl.utils.get_column_letter(col)
-                ws.column_dimensions[col_letter].width = 15
+            wb = self.build_workbook(data)
             
             # Salva il file Excel temporaneo
             temp_file = os.path.join(os.path.dirname(self.pdf_file), 
@@ -124,20 +248,26 @@ class PDFConverter:
             wb.save(temp_file)
             wb.close()
             
-            messagebox.showinfo("PDF Convertito", f"PDF convertito con successo!\nTrovati {len(data)} articoli.\nEsempio: {data[0][0]} - {data[0][1]} - {data[0][2]}")
+            self._info("PDF Convertito", f"PDF convertito con successo!\nTrovati {len(data)} articoli.\nEsempio: {data[0].code} - {data[0].quantity} - {data[0].unit_qty}")
             return temp_file
             
         except Exception as e:
-            messagebox.showerror("Errore", f"Impossibile convertire PDF in Excel: {str(e)}")
+            self._error("Errore", f"Impossibile convertire PDF in Excel: {str(e)}")
             return None
 
-class SparConverter:
-    def __init__(self, conversion_file, input_file):
+class SparConverter(MessageMixin):
+    def __init__(self, conversion_file, input_file, interactive=True, workbook=None, order_lines=None):
         self.conversion_file = conversion_file
         self.input_file = input_file
-        self.wb = None
+        self.interactive = interactive
+        self.output_file = None
+        self.wb = workbook  # Workbook già in memoria, altrimenti caricato da input_file
+        self.order_lines = order_lines  # Righe già estratte da un PDF
         self.ws = None
         self.start_row = None
+        self.start_row_confidence = None  # Confidenza della riga rilevata (None se inserita dall'utente)
+        self.result_lines = None
+        self.deleted_rows = 0
         
     def debug_data(self):
         """Mostra i dati per debug"""
@@ -156,14 +286,20 @@ class SparConverter:
         
         return debug_info
     
-    def load_workbook(self):
-        """Carica il file Excel di input"""
+    def load_workbook(self, read_only=False):
+        """Carica il file Excel di input (read_only per la sola lettura dei valori)"""
+        if self.wb is None and self.order_lines is not None:
+            # Righe estratte da PDF: il foglio serve solo per il workbook completo
+            self.wb = PDFConverter(self.input_file, interactive=False).build_workbook(self.order_lines)
+        if self.wb is not None:
+            self.ws = self.wb.active
+            return True
         try:
-            self.wb = openpyxl.load_workbook(self.input_file)
+            self.wb = openpyxl.load_workbook(self.input_file, read_only=read_only)
             self.ws = self.wb.active
             return True
         except Exception as e:
-            messagebox.showerror("Errore", f"Impossibile caricare il file: {str(e)}")
+            self._error("Errore", f"Impossibile caricare il file: {str(e)}")
             return False
     
     def pre_processing(self):
@@ -183,28 +319,49 @@ class SparConverter:
             self.ws.row_dimensions[row].height = 15
         
         # 4. Auto-adatta la larghezza di tutte le colonne
-        for col in range(1, self.ws.max_column + 1):
-            max_length = 0
-            col_letter = openpyxl.utils.get_column_letter(col)
-            for row in range(1, self.ws.max_row + 1):
-                try:
-                    cell_value = self.ws.cell(row=row, column=col).value
-                    if cell_value:
-                        max_length = max(max_length, len(str(cell_value)))
-                except:
-                    pass
-            adjusted_width = (max_length + 2)
-            self.ws.column_dimensions[col_letter].width = adjusted_width
+        self.autofit_columns()
+    
+    def detect_start_row(self, conversion_dict):
+        """Individua la riga di partenza analizzando le prime righe del foglio.
+        
+        Restituisce (riga, confidenza) con confidenza tra 0 e 1,
+        oppure (None, 0.0) se non trova righe di articoli.
+        """
+        # iter_rows funziona anche con i workbook in sola lettura
+        rows = self.ws.iter_rows(min_row=1, max_col=1, values_only=True)
+        return detect_start_row((values[0] if values else None for values in rows), conversion_dict)
     
-    def get_start_row(self):
-        """Chiede all'utente la riga di partenza"""
+    def get_start_row(self, conversion_dict=None):
+        """Determina la riga di partenza, chiedendo all'utente solo se la rilevazione e' incerta"""
+        detected_row = None
+        confidence = 0.0
+        if conversion_dict is not None:
+            detected_row, confidence = self.detect_start_row(conversion_dict)
+            self.start_row_confidence = confidence
+            if detected_row is not None and confidence >= START_ROW_MIN_CONFIDENCE:
+                return detected_row
+        
+        # Senza interfaccia una rilevazione incerta fa fallire il file
+        if not self.interactive:
+            if detected_row is None:
+                self._error("Errore", "Impossibile rilevare la riga di partenza")
+            else:
+                self._error(
+                    "Errore",
+                    f"Riga di partenza incerta: riga {detected_row} con confidenza {confidence:.2f} "
+                    f"(minimo {START_ROW_MIN_CONFIDENCE})"
+                )
+            return None
+        
+        self.start_row_confidence = None
+        
         root = tk.Tk()
         root.withdraw()
         
         user_input = simpledialog.askstring(
             "Riga di Partenza", 
             "Inserisci il numero della riga di partenza (di solito 2 per file PDF convertiti):", 
-            initialvalue="2"
+            initialvalue=str(detected_row or 2)
         )
         
         root.destroy()
@@ -215,7 +372,7 @@ class SparConverter:
         try:
             return int(user_input)
         except ValueError:
-            messagebox.showerror("Errore", "Inserisci un numero valido!")
+            self._error("Errore", "Inserisci un numero valido!")
             return None
     
     def load_conversion_table(self):
@@ -239,11 +396,11 @@ class SparConverter:
             conversion_wb.close()
             
             # Mostra debug della tabella di conversione
-            messagebox.showinfo("Debug Tabella Conversione", debug_info)
+            self._info("Debug Tabella Conversione", debug_info)
             return conversion_dict
             
         except Exception as e:
-            messagebox.showerror("Errore", f"Impossibile caricare la tabella di conversione: {str(e)}")
+            self._error("Errore", f"Impossibile caricare la tabella di conversione: {str(e)}")
             return None
     
     def apply_vlookup(self, conversion_dict):
@@ -280,7 +437,7 @@ class SparConverter:
         if len(lookup_results) > 10:
             results_text += f"\n... e altre {len(lookup_results) - 10} righe"
         
-        messagebox.showinfo("Risultati VLOOKUP", results_text)
+        self._info("Risultati VLOOKUP", results_text)
     
     def insert_column_and_apply_formula(self):
         """Inserisce una colonna tra C e D e applica la formula IF"""
@@ -289,11 +446,6 @@ class SparConverter:
         
         last_row = self.ws.max_row
         
-        # Codici speciali per le moltiplicazioni (come nel VBA originale)
-        multiply_4_codes = [11005101, 11005102, 11005111, 11005112, 11005107, 11005113]
-        multiply_3_codes = [11005382, 11005387]
-        multiply_2_codes = [11004140, 11004141]
-        
         calculation_results = []
         
         for row in range(self.start_row, last_row + 1):
@@ -311,18 +463,8 @@ class SparConverter:
                         value_e = 0
                 
                 # Applica le moltiplicazioni come nel VBA originale
-                if code in multiply_4_codes:
-                    result = value_e * 4
-                    multiplier = 4
-                elif code in multiply_3_codes:
-                    result = value_e * 3
-                    multiplier = 3
-                elif code in multiply_2_codes:
-                    result = value_e * 2
-                    multiplier = 2
-                else:
-                    result = value_e * 1
-                    multiplier = 1
+                multiplier = CODE_MULTIPLIERS.get(code, 1)
+                result = value_e * multiplier
                 
                 self.ws[f'D{row}'] = result
                 calculation_results.append(f"Riga {row}: Codice {code} x {multiplier} = {result}")
@@ -336,7 +478,7 @@ class SparConverter:
             calc_text = "\n".join(calculation_results[:10])
             if len(calculation_results) > 10:
                 calc_text += f"\n... e altre {len(calculation_results) - 10} righe"
-            messagebox.showinfo("Risultati Calcoli", calc_text)
+            self._info("Risultati Calcoli", calc_text)
     
     def delete_zero_rows(self):
         """Elimina le righe con 0 nella colonna C"""
@@ -354,7 +496,7 @@ class SparConverter:
         # Mostra quali righe verranno eliminate
         if rows_to_delete:
             delete_info = f"Righe da eliminare (con 0 in colonna C): {rows_to_delete}"
-            messagebox.showinfo("Debug Eliminazione", delete_info)
+            self._info("Debug Eliminazione", delete_info)
         
         # Elimina le righe dalla fine per evitare problemi con gli indici
         deleted_count = 0
@@ -364,32 +506,72 @@ class SparConverter:
         
         return deleted_count
     
-    def convert(self, is_pdf_conversion=False):
-        """Esegue l'intero processo di conversione"""
+    def transform(self, output_format="xlsx", conversion_dict=None):
+        """Carica il file e applica la conversione in memoria, senza salvare.
+        
+        conversion_dict permette di riutilizzare una tabella già caricata.
+        """
+        if output_format not in OUTPUT_FORMATS:
+            self._error("Errore", f"Formato di output non supportato: {output_format}")
+            return False
+        
+        if self.order_lines is not None and output_format != "xlsx":
+            # Righe già estratte da PDF: lookup e moltiplicazioni direttamente sulle colonne
+            if conversion_dict is None:
+                conversion_dict = self.load_conversion_table()
+                if conversion_dict is None:
+                    return False
+            self.result_lines = self.order_lines.convert(conversion_dict)
+            self.deleted_rows = len(self.order_lines) - len(self.result_lines)
+            return True
+        
+        # Carica la tabella di conversione
+        if conversion_dict is None:
+            conversion_dict = self.load_conversion_table()
+            if conversion_dict is None:
+                return False
+        
+        if output_format != "xlsx":
+            # Formati snelli: sola lettura dei valori, nessun debug né formattazione del foglio
+            if not self.load_workbook(read_only=True):
+                return False
+            try:
+                self.start_row = self.get_start_row(conversion_dict)
+                if self.start_row is None:
+                    return False
+                
+                # Lookup e moltiplicazioni vettoriali, senza toccare il foglio
+                order_lines = self.read_order_lines()
+                if not len(order_lines):
+                    self._error("Errore", "La riga di partenza è oltre l'ultima riga con dati!")
+                    return False
+                self.result_lines = order_lines.convert(conversion_dict)
+                self.deleted_rows = len(order_lines) - len(self.result_lines)
+                return True
+            finally:
+                self.wb.close()
+        
         if not self.load_workbook():
             return False
         
         # DEBUG: Mostra i dati prima della conversione
         debug_info = self.debug_data()
-        messagebox.showinfo("Debug Dati Input", debug_info)
+        self._info("Debug Dati Input", debug_info)
         
         # PRE-STEP: Formattazione iniziale
         self.pre_processing()
         
-        # INPUT: Chiedi all'utente la riga di partenza
-        self.start_row = self.get_start_row()
+        # INPUT: Rileva la riga di partenza (chiede all'utente solo se incerta)
+        self.start_row = self.get_start_row(conversion_dict)
         if self.start_row is None:
             return False
         
         # Verifica che la riga di partenza sia valida
         if self.start_row > self.ws.max_row:
-            messagebox.showerror("Errore", "La riga di partenza è oltre l'ultima riga con dati!")
+            self._error("Errore", "La riga di partenza è oltre l'ultima riga con dati!")
             return False
         
-        # Carica la tabella di conversione
-        conversion_dict = self.load_conversion_table()
-        if conversion_dict is None:
-            return False
+        self.result_lines = None
         
         # PRIMO STEP: Applica VLOOKUP nella colonna C
         self.apply_vlookup(conversion_dict)
@@ -398,62 +580,157 @@ class SparConverter:
         self.insert_column_and_apply_formula()
         
         # TERZO STEP: Elimina righe con 0 nella colonna C
-        deleted_rows = self.delete_zero_rows()
-        
-        # QUARTO STEP: Ri-applica auto-fit alle colonne
-        for col in range(1, self.ws.max_column + 1):
-            max_length = 0
-            col_letter = openpyxl.utils.get_column_letter(col)
-            for row in range(1, self.ws.max_row + 1):
-                try:
-                    cell_value = self.ws.cell(row=row, column=col).value
-                    if cell_value:
-                        max_length = max(max_length, len(str(cell_value)))
-                except:
-                    pass
-            adjusted_width = (max_length + 2)
-            self.ws.column_dimensions[col_letter].width = adjusted_width
+        self.deleted_rows = self.delete_zero_rows()
         
-        # Salva il file convertito
+        return True
+    
+    def get_output_file(self, is_pdf_conversion=False, output_format="xlsx"):
+        """Restituisce il percorso del file convertito"""
         if is_pdf_conversion:
             # Usa il nome originale del PDF
             original_pdf_name = os.path.basename(self.input_file).replace('temp_conversion_', '').replace('.xlsx', '')
-            output_file = os.path.join(os.path.dirname(self.input_file), f"{original_pdf_name}_CONVERTITO.xlsx")
+            base_name = os.path.join(os.path.dirname(self.input_file), original_pdf_name)
         else:
             base_name = os.path.splitext(self.input_file)[0]
-            output_file = f"{base_name}_CONVERTITO.xlsx"
+        return f"{base_name}_CONVERTITO{OUTPUT_FORMATS[output_format]}"
+    
+    def convert(self, is_pdf_conversion=False, output_format="xlsx", conversion_dict=None):
+        """Esegue l'intero processo di conversione"""
+        if not self.transform(output_format, conversion_dict):
+            return False
+        
+        # QUARTO STEP: Salva il file convertito nel formato richiesto
+        output_file = self.get_output_file(is_pdf_conversion, output_format)
         
         try:
-            self.wb.save(output_file)
-            self.wb.close()
+            final_row_count = self.save_output(output_file, output_format, self.result_lines)
             
-            # DEBUG: Controlla se il file finale ha dati
-            if os.path.exists(output_file):
-                final_wb = openpyxl.load_workbook(output_file)
-                final_ws = final_wb.active
-                final_row_count = final_ws.max_row
-                final_wb.close()
-                
-                final_info = f"File salvato: {output_file}\nRighe nel file finale: {final_row_count}"
-                messagebox.showinfo("Debug File Finale", final_info)
+            # DEBUG: Righe scritte (contate in memoria, senza rileggere il file)
+            final_info = f"File salvato: {output_file}\nRighe nel file finale: {final_row_count}"
+            self._info("Debug File Finale", final_info)
             
             # Messaggio di completamento
-            messagebox.showinfo(
+            self._info(
                 "Automazione Completata!",
                 f"Conversione terminata con successo!\n\n"
                 f"Riga di partenza: {self.start_row}\n"
-                f"Righe eliminate: {deleted_rows}\n"
+                f"Righe eliminate: {self.deleted_rows}\n"
                 f"File salvato come: {os.path.basename(output_file)}\n"
                 f"Percorso: {output_file}"
             )
             
+            self.output_file = output_file
+            
             # Apri la cartella contenente il file
-            os.startfile(os.path.dirname(output_file))
+            if self.interactive:
+                os.startfile(os.path.dirname(output_file))
             return True
             
         except Exception as e:
-            messagebox.showerror("Errore", f"Impossibile salvare il file: {str(e)}")
+            self._error("Errore", f"Impossibile salvare il file: {str(e)}")
             return False
+    
+    def dry_run(self, conversion_dict=None):
+        """Verifica l'ordine contro la tabella di conversione senza formattare né salvare.
+        
+        Restituisce un riepilogo serializzabile in JSON, oppure None in caso di errore.
+        """
+        if conversion_dict is None:
+            conversion_dict = self.load_conversion_table()
+            if conversion_dict is None:
+                return None
+        
+        if self.order_lines is not None:
+            # Righe già estratte da PDF: nessun foglio da leggere
+            report = {"file": self.input_file, "riga_partenza": None, "confidenza_riga": None}
+            report.update(self.order_lines.validation_report(conversion_dict))
+            return report
+        
+        # Sola lettura: nessuna modifica né formattazione del foglio
+        if not self.load_workbook(read_only=True):
+            return None
+        
+        try:
+            self.start_row = self.get_start_row(conversion_dict)
+            if self.start_row is None:
+                return None
+            
+            report = {
+                "file": self.input_file,
+                "riga_partenza": self.start_row,
+                "confidenza_riga": self.start_row_confidence,
+            }
+            report.update(self.read_order_lines().validation_report(conversion_dict))
+            return report
+        finally:
+            self.wb.close()
+    
+    def read_order_lines(self):
+        """Legge codici articolo (colonna A) e quantità (colonna D) dalla riga di partenza"""
+        codes = array('q')
+        quantities = array('d')
+        for row in self.ws.iter_rows(min_row=self.start_row, max_col=4, values_only=True):
+            row = tuple(row) + (None,) * (4 - len(row))
+            code = article_code_or_zero(row[0])
+            try:
+                quantity = float(row[3]) if row[3] is not None else 0.0
+            except (ValueError, TypeError):
+                quantity = 0.0
+            # I codici non validi restano a 0 e vengono scartati come nel VLOOKUP
+            codes.append(code)
+            quantities.append(quantity)
+        return OrderLines(codes, quantities)
+    
+    def autofit_columns(self):
+        """Auto-adatta la larghezza di tutte le colonne"""
+        for col in range(1, self.ws.max_column + 1):
+            max_length = 0
+            col_letter = openpyxl.utils.get_column_letter(col)
+            for row in range(1, self.ws.max_row + 1):
+                try:
+                    cell_value = self.ws.cell(row=row, column=col).value
+                    if cell_value:
+                        max_length = max(max_length, len(str(cell_value)))
+                except:
+                    pass
+            adjusted_width = (max_length + 2)
+            self.ws.column_dimensions[col_letter].width = adjusted_width
+    
+    def save_output(self, output_file, output_format="xlsx", result_lines=None):
+        """Salva il risultato nel formato richiesto e restituisce il numero di righe scritte.
+        
+        Per i formati snelli result_lines contiene le righe già convertite.
+        """
+        if output_format == "xlsx":
+            # Workbook completo con formattazione
+            self.autofit_columns()
+            self.wb.save(output_file)
+            row_count = self.ws.max_row
+            self.wb.close()
+            return row_count
+        
+        # Formati snelli: solo codice convertito e quantità
+        if self.wb is not None:
+            self.wb.close()
+        
+        if output_format == "xlsx-lean":
+            out_wb = openpyxl.Workbook(write_only=True)
+            out_ws = out_wb.create_sheet("Order Data")
+            out_ws.append(OUTPUT_HEADERS)
+            for row in result_lines.to_rows():
+                out_ws.append(row)
+            out_wb.save(output_file)
+        elif output_format == "csv":
+            with open(output_file, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f, delimiter=';')
+                writer.writerow(OUTPUT_HEADERS)
+                writer.writerows(result_lines.to_rows())
+        elif output_format == "parquet":
+            result_lines.to_dataframe(OUTPUT_HEADERS).to_parquet(output_file, index=False)
+        else:
+            raise ValueError(f"Formato di output non supportato: {output_format}")
+        
+        return len(result_lines)
 
 def select_file(title, file_types):
     """Seleziona un file tramite dialog"""
@@ -463,6 +740,28 @@ def select_file(title, file_types):
     root.destroy()
     return file_path
 
+def select_output_format():
+    """Chiede all'utente il formato del file convertito"""
+    root = tk.Tk()
+    root.withdraw()
+    
+    user_input = simpledialog.askstring(
+        "Formato di Output",
+        "Formato del file convertito (" + ", ".join(OUTPUT_FORMATS) + "):",
+        initialvalue="xlsx"
+    )
+    
+    root.destroy()
+    
+    if user_input is None or user_input.strip() == "":
+        return None
+    
+    output_format = user_input.strip().lower()
+    if output_format not in OUTPUT_FORMATS:
+        messagebox.showerror("Errore", f"Formato non supportato: {user_input}")
+        return None
+    return output_format
+
 def main():
     try:
         # Seleziona il file di conversione SPAR
@@ -474,6 +773,11 @@ def main():
         if not conversion_file:
             return
         
+        # Formato del file convertito
+        output_format = select_output_format()
+        if not output_format:
+            return
+        
         # Chiedi all'utente se vuole convertire PDF o usare Excel
         root = tk.Tk()
         root.withdraw()
@@ -517,7 +821,7 @@ def main():
         
         # Esegue la conversione SPAR
         converter = SparConverter(conversion_file, input_file)
-        success = converter.convert(is_pdf_conversion)
+        success = converter.convert(is_pdf_conversion, output_format)
         
         # Pulisci file temporaneo se era una conversione PDF
         if is_pdf_conversion and input_file and os.path.exists(input_file):
@@ -534,4 +838,8 @@ def main():
         messagebox.showerror("Errore Critico", f"Si è verificato un errore: {str(e)}")
 
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        # Con argomenti da riga di comando: conversione batch senza interfaccia
+        import batch
+        sys.exit(batch.main(sys.argv[1:]))
     main()
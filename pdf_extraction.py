@@ -0,0 +1,123 @@
+import re
+from array import array
+
+import pdfplumber
+
+try:
+    import resource  # Non disponibile su Windows
+except ImportError:
+    resource = None
+
+from articles import article_code_or_zero
+
+# Estrazione delle righe d'ordine dai PDF GSD. Il modulo non importa tkinter,
+# pandas né numpy: viene caricato anche nei processi di estrazione del batch.
+
+def looks_like_article_data(row):
+    """Verifica se la riga sembra contenere dati di articoli"""
+    if len(row) < 3:
+        return False
+
+    # Il primo campo dovrebbe essere un codice articolo (solo numeri)
+    article_ref = str(row[0]).strip()
+    if article_ref and re.match(r'^\d{5,}$', article_ref):  # Almeno 5 cifre
+        return True
+    return False
+
+def clean_row_data(row):
+    """Pulisce i dati della riga"""
+    try:
+        article_ref = str(row[0]).strip()
+        cases_ordered = str(row[1]).strip().replace(',', '.')
+        unit_qty = str(row[2]).strip().replace(',', '.')
+
+        # Verifica che siano numeri validi
+        if (re.match(r'^\d+$', article_ref) and
+            re.match(r'^\d*\.?\d+$', cases_ordered) and
+            re.match(r'^\d*\.?\d+$', unit_qty)):
+            return (int(article_ref), float(cases_ordered), float(unit_qty))
+    except:
+        pass
+    return None
+
+def extract_from_text(text):
+    """Estrae dati dal testo del PDF"""
+    data = []
+    lines = text.split('\n')
+
+    for line in lines:
+        # Cerca pattern: numero (8+ cifre) seguito da numeri decimali
+        match = re.search(r'(\d{8,})\s+(\d+\.?\d*)\s+(\d+\.?\d*)', line.strip())
+        if match:
+            article_ref = match.group(1)
+            cases_ordered = match.group(2)
+            unit_qty = match.group(3)
+            data.append((int(article_ref), float(cases_ordered), float(unit_qty)))
+
+    return data
+
+def extract_columns(pdf_file):
+    """Estrae dal PDF le colonne compatte (codici, colli ordinati, quantità unitarie)"""
+    codes = array('q')
+    cases = array('d')
+    unit_qtys = array('d')
+
+    with pdfplumber.open(pdf_file) as pdf:
+        for page in pdf.pages:
+            # Prova prima con l'estrazione delle tabelle
+            tables = page.extract_tables()
+
+            for table in tables:
+                for i, row in enumerate(table):
+                    # Salta l'header della tabella
+                    if i == 0 and ("Article Ref" in str(row) or "Cases Ordered" in str(row)):
+                        continue
+
+                    # Cerca righe con il formato: numero, numero, numero
+                    if (row and len(row) >= 3 and
+                        row[0] and row[1] and row[2] and
+                        looks_like_article_data(row)):
+                        clean_row = clean_row_data(row)
+                        if clean_row:
+                            codes.append(article_code_or_zero(clean_row[0]))
+                            cases.append(clean_row[1])
+                            unit_qtys.append(clean_row[2])
+
+            # Se non ha trovato dati nelle tabelle, prova con l'estrazione del testo
+            if not codes:
+                text = page.extract_text()
+                if text:
+                    for row in extract_from_text(text):
+                        codes.append(article_code_or_zero(row[0]))
+                        cases.append(row[1])
+                        unit_qtys.append(row[2])
+
+    return codes, cases, unit_qtys
+
+def extraction_worker(conn, max_memory_mb, extractor=extract_columns):
+    """Ciclo del processo di estrazione: riceve percorsi di PDF finché non riceve None.
+
+    Per ogni PDF risponde ("ok", colonne) oppure ("errore", messaggio). Dopo un
+    MemoryError risponde ("memoria", messaggio) e termina, per essere sostituito.
+    """
+    try:
+        # Limite di memoria del processo (solo dove supportato)
+        if max_memory_mb and resource is not None:
+            limit = max_memory_mb * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+        while True:
+            pdf_file = conn.recv()
+            if pdf_file is None:
+                return
+            try:
+                conn.send(("ok", extractor(pdf_file)))
+            except MemoryError:
+                conn.send(("memoria", f"Limite di memoria superato ({max_memory_mb} MB)"))
+                return
+            except Exception as e:
+                conn.send(("errore", f"Impossibile leggere il PDF: {str(e)}"))
+    except (EOFError, OSError):
+        pass  # Processo principale terminato
+    finally:
+        conn.close()
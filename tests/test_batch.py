@@ -0,0 +1,105 @@
+import csv
+import time
+from array import array
+
+import openpyxl
+import pytest
+
+from batch import ExtractionWorker, extract_isolated, memory_limit_supported, run_pipeline
+
+def make_pdf(path, lines):
+    """Scrive un PDF minimo di una pagina con le righe di testo indicate"""
+    text = "BT /F1 12 Tf 14 TL 50 750 Td " + " ".join(f"({line}) '" for line in lines) + " ET"
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        "<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+        "/Resources << /Font << /F1 4 0 R >> >> /Contents 5 0 R >>",
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+        f"<< /Length {len(text)} >>\nstream\n{text}\nendstream",
+    ]
+    pdf = "%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(pdf))
+        pdf += f"{number} 0 obj\n{body}\nendobj\n"
+    xref = len(pdf)
+    pdf += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n"
+    pdf += "".join(f"{offset:010d} 00000 n \n" for offset in offsets)
+    pdf += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n"
+    path.write_bytes(pdf.encode("latin-1"))
+
+def make_conversion_file(path):
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = "Sheet1"
+    ws.append([None, 12345678, 11005101])  # Moltiplicatore 4
+    ws.append([None, 22222222, 555])
+    wb.save(path)
+
+# Estrattori finti: funzioni di modulo, per poter essere passate al processo
+
+def quick_extractor(pdf_file):
+    return array('q', [12345678]), array('d', [2.0]), array('d', [6.0])
+
+def slow_extractor(pdf_file):
+    time.sleep(60)
+    return quick_extractor(pdf_file)
+
+def memory_hog_extractor(pdf_file):
+    data = b"x" * (600 * 1024 * 1024)  # Scrive davvero 600 MB
+    time.sleep(60)
+    return data
+
+def failing_extractor(pdf_file):
+    raise ValueError("PDF danneggiato")
+
+def test_extract_returns_order_lines():
+    data, error = extract_isolated("ordine.pdf", 30, 0, quick_extractor)
+    assert error is None
+    assert data.to_rows() == [[12345678, 2.0]]
+    assert data.unit_qtys.tolist() == [6.0]
+
+def test_slow_extraction_times_out():
+    start = time.monotonic()
+    data, error = extract_isolated("ordine.pdf", 0.5, 0, slow_extractor)
+    assert data is None
+    assert "Timeout" in error
+    assert time.monotonic() - start < 10
+
+@pytest.mark.skipif(not memory_limit_supported(), reason="limite di memoria non supportato")
+def test_extraction_over_memory_limit_is_stopped():
+    data, error = extract_isolated("ordine.pdf", 30, 400, memory_hog_extractor)
+    assert data is None
+    assert "memoria" in error
+
+def test_worker_is_replaced_only_when_killed():
+    with ExtractionWorker(0, slow_extractor) as worker:
+        assert worker.extract("lento.pdf", 0.5)[0] is None
+        assert worker.process is None  # Terminato, verrà sostituito
+
+    with ExtractionWorker(0, failing_extractor) as worker:
+        assert worker.extract("a.pdf", 30) == (None, "Impossibile leggere il PDF: PDF danneggiato")
+        pid = worker.process.pid
+        assert worker.extract("b.pdf", 30)[1] is not None
+        assert worker.process.pid == pid  # Un errore di lettura non sostituisce il processo
+
+def test_pipeline_marks_only_corrupt_pdf_as_failed(tmp_path):
+    orders = tmp_path / "ordini"
+    orders.mkdir()
+    make_pdf(orders / "a.pdf", ["Article Ref Cases Unit", "12345678 2 6", "99999999 5 1"])
+    (orders / "b.pdf").write_bytes(b"%PDF-1.4 non e' un PDF")
+    make_pdf(orders / "c.pdf", ["22222222 3 1"])
+    conversion_file = tmp_path / "conversione.xlsx"
+    make_conversion_file(conversion_file)
+
+    results, report = run_pipeline(str(orders), str(conversion_file), "csv", timeout=60, max_memory_mb=0)
+
+    assert [result["file"] for result in results] == [str(orders / name) for name in ("a.pdf", "b.pdf", "c.pdf")]
+    assert [result["ok"] for result in results] == [True, False, True]
+    assert "Impossibile leggere il PDF" in results[1]["errore"]
+    assert report["estrazione"]["elaborati"] == 3
+    assert report["scrittura"]["elaborati"] == 2
+
+    with open(results[0]["output"], newline="", encoding="utf-8") as f:
+        assert list(csv.reader(f, delimiter=";")) == [["Codice", "Quantita"], ["11005101", "8.0"]]
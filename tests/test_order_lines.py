@@ -0,0 +1,177 @@
+import csv
+
+import numpy as np
+import openpyxl
+import pytest
+
+from main import OUTPUT_FORMATS, OUTPUT_HEADERS, OrderLines, SparConverter
+
+CONVERSION = {
+    12345678: 11005101,   # Moltiplicatore 4
+    22222222: "ABC-1",    # Valore non numerico
+    33333333: 555,
+    44444444: "0",        # Scartato come in delete_zero_rows
+    55555555: 11004140.0, # Moltiplicatore 2, valore float
+    11005382: 11005382,   # Moltiplicatore 3
+}
+
+ORDER = [
+    ("12345678", 5),
+    (22222222, 2),
+    (" 33333333 ", "3"),
+    ("99999999", 7),
+    (None, 1),
+    ("Totale", 18),
+    (44444444, 4),
+    (55555555, 1.5),
+    (11005382.0, None),
+    ("123456789012345678901", 9),
+    (33333333, "x"),
+]
+
+def make_converter():
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.append(["Article Ref", "Cases", "Unit", "Qty"])
+    for code, quantity in ORDER:
+        ws.append([code, 1, 1, quantity])
+    converter = SparConverter(None, "ordine.xlsx", interactive=False, workbook=wb)
+    converter.load_workbook()
+    converter.start_row = 2
+    return converter
+
+def save_order(folder):
+    order_file = folder / "ordine.xlsx"
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.append(["Article Ref", "Cases", "Unit", "Qty"])
+    for code, quantity in ORDER:
+        ws.append([code, 1, 1, quantity])
+    wb.save(order_file)
+    return order_file
+
+def xlsx_result(conversion):
+    """Risultato del percorso su foglio (VLOOKUP, formula IF, eliminazione)"""
+    converter = make_converter()
+    converter.apply_vlookup(conversion)
+    converter.insert_column_and_apply_formula()
+    converter.delete_zero_rows()
+    ws = converter.ws
+    return [[ws[f'C{row}'].value, ws[f'D{row}'].value] for row in range(2, ws.max_row + 1)]
+
+def lean_result(conversion):
+    return make_converter().read_order_lines().convert(conversion).to_rows()
+
+def test_convert_matches_worksheet_path():
+    expected = xlsx_result(CONVERSION)
+    assert lean_result(CONVERSION) == expected
+    assert expected == [
+        [11005101, 20.0],
+        ["ABC-1", 2.0],
+        [555, 3.0],
+        [11004140.0, 3.0],
+        [11005382, 0.0],
+        [555, 0.0],
+    ]
+
+def test_convert_matches_worksheet_path_with_integer_table():
+    conversion = {12345678: 11005101, 33333333: 555, 11005382: 11005382}
+    assert lean_result(conversion) == xlsx_result(conversion)
+    assert make_converter().read_order_lines().convert(conversion).codes.dtype == np.int64
+
+def test_out_of_range_code_is_invalid():
+    lines = make_converter().read_order_lines()
+    assert lines.codes.dtype == np.int64
+    assert lines.codes[9] == 0
+
+def test_map_codes_keeps_table_values():
+    lines = OrderLines([22222222, 12345678, 1], [1, 1, 1])
+    assert lines.map_codes(CONVERSION).tolist() == ["ABC-1", 11005101, 0]
+
+def test_record_view_and_concat():
+    lines = OrderLines.concat([OrderLines([1, 2], [1.0, 2.0], [3.0, 4.0])] * 2)
+    assert len(lines) == 4
+    line = lines[1]
+    assert (line.code, line.quantity, line.unit_qty) == (2, 2.0, 4.0)
+    assert lines[lines.codes == 2].quantities.tolist() == [2.0, 2.0]
+
+def test_validation_report_matches_conversion():
+    lines = make_converter().read_order_lines()
+    report = lines.validation_report(CONVERSION)
+    converted = lines.convert(CONVERSION)
+    assert report["righe"] == len(ORDER)
+    assert report["righe_convertite"] == len(converted)
+    assert report["righe_eliminate"] == len(ORDER) - len(converted)
+    assert report["righe_non_valide"] == 3
+    # 22222222 e' in tabella (valore non numerico) e non va segnalato
+    assert report["codici_non_mappati"] == [44444444, 99999999]
+    assert report["moltiplicatori"] == {
+        "11005101": {"moltiplicatore": 4, "righe": 1},
+        "11005382": {"moltiplicatore": 3, "righe": 1},
+        "11004140": {"moltiplicatore": 2, "righe": 1},
+    }
+    assert report["quantita_totale"] == float(converted.quantities.sum())
+
+def test_pdf_lines_match_worksheet_path():
+    # Righe come estratte dal PDF: codice, colli ordinati, quantità unitaria
+    extracted = OrderLines([12345678, 99999999, 22222222], [2.0, 5.0, 3.0], [6.0, 1.0, 4.0])
+
+    lean = SparConverter(None, "ordine.pdf", interactive=False, order_lines=extracted)
+    assert lean.transform("csv", CONVERSION)
+    assert lean.result_lines.to_rows() == [[11005101, 8.0], ["ABC-1", 3.0]]
+
+    full = SparConverter(None, "ordine.pdf", interactive=False, order_lines=extracted)
+    assert full.transform("xlsx", CONVERSION)
+    ws = full.ws
+    rows = [[ws[f'C{row}'].value, ws[f'D{row}'].value] for row in range(full.start_row, ws.max_row + 1)]
+    assert rows == lean.result_lines.to_rows()
+
+def test_pdf_lines_dry_run():
+    extracted = OrderLines([12345678, 99999999], [2.0, 5.0], [6.0, 1.0])
+    report = SparConverter(None, "ordine.pdf", interactive=False, order_lines=extracted).dry_run(CONVERSION)
+    assert report["codici_non_mappati"] == [99999999]
+    assert report["quantita_totale"] == 8.0
+
+def test_dry_run_reads_excel_order(tmp_path):
+    order_file = save_order(tmp_path)
+    report = SparConverter(None, str(order_file), interactive=False).dry_run(CONVERSION)
+    assert report["riga_partenza"] == 2
+    assert report == {**report, **make_converter().read_order_lines().validation_report(CONVERSION)}
+
+def test_lean_transform_reads_excel_order_read_only(tmp_path):
+    order_file = save_order(tmp_path)
+    converter = SparConverter(None, str(order_file), interactive=False)
+    assert converter.transform("csv", CONVERSION)
+    assert converter.wb.read_only
+    assert converter.start_row == 2
+    assert converter.result_lines.to_rows() == xlsx_result(CONVERSION)
+
+def save_result(tmp_path, output_format, extension):
+    converter = make_converter()
+    result_lines = converter.read_order_lines().convert(CONVERSION)
+    output_file = tmp_path / f"ordine_CONVERTITO{extension}"
+    assert converter.save_output(str(output_file), output_format, result_lines) == len(result_lines)
+    return output_file, result_lines.to_rows()
+
+def test_csv_round_trip(tmp_path):
+    output_file, rows = save_result(tmp_path, "csv", ".csv")
+    with open(output_file, newline="", encoding="utf-8") as f:
+        read_back = list(csv.reader(f, delimiter=";"))
+    assert read_back == [OUTPUT_HEADERS] + [[str(code), str(quantity)] for code, quantity in rows]
+
+def test_xlsx_lean_round_trip(tmp_path):
+    output_file, rows = save_result(tmp_path, "xlsx-lean", ".xlsx")
+    wb = openpyxl.load_workbook(output_file, read_only=True)
+    try:
+        read_back = [list(row) for row in wb["Order Data"].iter_rows(values_only=True)]
+    finally:
+        wb.close()
+    assert read_back == [OUTPUT_HEADERS] + rows
+
+@pytest.mark.skipif("parquet" not in OUTPUT_FORMATS, reason="pyarrow non installato")
+def test_parquet_round_trip(tmp_path):
+    import pandas as pd
+    output_file, rows = save_result(tmp_path, "parquet", ".parquet")
+    read_back = pd.read_parquet(output_file)
+    assert list(read_back.columns) == OUTPUT_HEADERS
+    assert read_back.values.tolist() == [[str(code), quantity] for code, quantity in rows]
@@ -0,0 +1,62 @@
+import openpyxl
+
+from main import SparConverter
+
+CONVERSION = {12345678: 11005101, 22222222: 555}
+
+def make_converter(column_a):
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    for value in column_a:
+        ws.append([value, 1, None, 5])
+    return SparConverter(None, "ordine.xlsx", interactive=False, workbook=wb)
+
+def detect(column_a, conversion=CONVERSION):
+    converter = make_converter(column_a)
+    converter.load_workbook()
+    return converter.detect_start_row(conversion)
+
+def test_header_followed_by_codes():
+    assert detect(["Article Ref", "12345678", "22222222"]) == (2, 1.0)
+
+def test_code_in_conversion_table():
+    assert detect(["Ordine", None, 22222222, 12345678]) == (3, 1.0)
+
+def test_unknown_block_continues_to_known_codes():
+    assert detect(["Ordine", "99999999", "12345678"]) == (2, 0.8)
+
+def test_order_number_preamble_is_skipped():
+    # Numero d'ordine, riga vuota, intestazione e poi i codici veri
+    rows = [20261019, None, "Article Ref", "12345678", "22222222"]
+    assert detect(rows) == (4, 1.0)
+
+def test_preamble_without_header_prefers_known_codes():
+    rows = [20261019, None, "99999999", "12345678"]
+    assert detect(rows) == (3, 0.8)
+
+def test_only_unknown_codes_is_low_confidence():
+    assert detect(["Ordine", "99999999", "88888888"]) == (2, 0.4)
+
+def test_header_without_codes():
+    assert detect(["Article Ref", "Totale"]) == (2, 0.3)
+
+def test_nothing_found():
+    assert detect(["Ordine", "Totale"]) == (None, 0.0)
+
+def test_unattended_low_confidence_fails():
+    converter = make_converter([20261019, None, "99999999"])
+    converter.load_workbook()
+    assert converter.get_start_row({}) is None
+    assert converter.start_row_confidence == 0.4
+    assert "incerta" in converter.last_error
+
+def test_unattended_confident_row_is_used():
+    converter = make_converter([20261019, None, "Article Ref", "12345678"])
+    converter.load_workbook()
+    assert converter.get_start_row(CONVERSION) == 4
+    assert converter.start_row_confidence == 1.0
+
+def test_non_decimal_digits_are_not_codes():
+    from main import parse_article_code
+    assert parse_article_code("²") is None
+    assert detect(["²", "Article Ref", "12345678"]) == (3, 1.0)